@@ -1,18 +1,26 @@
-from fastapi import FastAPI, HTTPException, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, validator, Field
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 #import google.generativeai as genai
 import os
+import sys
 from dotenv import load_dotenv
-import json
+from cachetools import TTLCache
+import httpx
+import orjson
+import redis.asyncio as aioredis
 import logging
 import hashlib
 import asyncio
+import re
 import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from code_analyzer import generate_execution_steps
@@ -29,34 +37,62 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks"""
+    global redis_client
+    if REDIS_URL:
+        redis_client = aioredis.from_url(REDIS_URL)
+        logger.info("💾 Response cache backed by Redis")
+    yield
+    VIZ_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    if redis_client is not None:
+        await redis_client.aclose()
+
 app = FastAPI(
     title="CodeSense AI API",
     version="2.0.0",
-    description="AI-powered code explanation, debugging, and visualization"
+    description="AI-powered code explanation, debugging, and visualization",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiting: moving window (no 2x burst at window edges), stored in Redis
+# when REDIS_URL is set so limits hold across uvicorn workers. If Redis goes
+# down, limits fall back to per-process memory instead of failing requests.
+REDIS_URL = os.getenv("REDIS_URL")
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=REDIS_URL or "memory://",
+    strategy="moving-window",
+    in_memory_fallback_enabled=True
+)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 
 # CORS with environment-based configuration
 
-# Parse ALLOWED_ORIGINS and strip whitespace
-allowed_origins_str = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000")
-ALLOWED_ORIGINS = [origin.strip() for origin in allowed_origins_str.split(",")]
+# Parse ALLOWED_ORIGINS and strip whitespace ("*" matches one subdomain label)
+DEFAULT_ALLOWED_ORIGINS = ",".join([
+    "http://localhost:3000",
+    "https://codesense-2yre28va2-saileed05s-projects.vercel.app",
+    "https://codesense-ai-one.vercel.app",
+    "https://codesense-ai-saileed05-saileed05s-projects.vercel.app"
+])
+allowed_origins_str = os.getenv("ALLOWED_ORIGINS", DEFAULT_ALLOWED_ORIGINS)
+ALLOWED_ORIGINS = [origin.strip() for origin in allowed_origins_str.split(",") if origin.strip()]
+
+# Single regex so wildcard origins actually match (CORSMiddleware compiles it once)
+ALLOWED_ORIGIN_REGEX = "|".join(
+    re.escape(origin).replace(r"\*", r"[^.]+") for origin in ALLOWED_ORIGINS
+)
 
 # Log for debugging
-logger.info(f"🌐 Configured CORS origins: {ALLOWED_ORIGINS}")
+logger.info("🌐 Configured CORS origins: %s", ALLOWED_ORIGINS)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "https://codesense-2yre28va2-saileed05s-projects.vercel.app",
-        "https://codesense-ai-one.vercel.app",
-        "https://codesense-ai-saileed05-saileed05s-projects.vercel.app"
-    ],  # Remove the wildcard line!
+    allow_origin_regex=ALLOWED_ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
@@ -66,9 +102,15 @@ app.add_middleware(
 
 # Gemini API configuration
 API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "gemini-2.5-flash"
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 MAX_CODE_LENGTH = int(os.getenv("MAX_CODE_LENGTH", "10000"))
 ALLOWED_LANGUAGES = ["python", "javascript", "java", "cpp", "typescript", "go", "c", "ruby"]
 ALLOWED_LEVELS = ["eli5", "beginner", "intermediate", "expert"]
+DANGEROUS_PATTERNS_RE = re.compile(r'__import__|eval\(|exec\(|compile\(', re.IGNORECASE)
+
+# Dedicated thread pool for CPU-bound visualizer runs (Gemini calls are async)
+VIZ_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="viz")
 
 # Retry configuration
 MAX_RETRIES = 3
@@ -77,35 +119,189 @@ MAX_DELAY = 60  # seconds
 
 if API_KEY:
     try:
-        client = genai.Client(api_key=API_KEY)
+        # One pooled keep-alive HTTP/2 connection set shared by all Gemini calls,
+        # so bursts don't pay a TCP + TLS handshake per request
+        client = genai.Client(
+            api_key=API_KEY,
+            http_options=types.HttpOptions(
+                async_client_args={
+                    "limits": httpx.Limits(
+                        max_connections=100,
+                        max_keepalive_connections=20,
+                        keepalive_expiry=300
+                    ),
+                    "http2": True
+                }
+            )
+        )
         logger.info("✅ Gemini client configured successfully")
     except Exception as e:
-        logger.error(f"❌ Gemini client configuration failed: {e}")
+        logger.error("❌ Gemini client configuration failed: %s", e)
         client = None
 else:
     logger.error("❌ GEMINI_API_KEY not found in environment!")
     client = None
 
 
-# Response caching (in-memory)
-response_cache = {}
+# Prompt templates: a static prefix with the instructions and JSON schema, and a
+# suffix formatted with the per-request values. Only the suffix goes through
+# str.format, so the schema's braces need no escaping.
+EXPLAIN_PROMPT_PREFIX = """You are an expert coding instructor. Explain the code given at the end of this prompt at the requested level.
+
+Return a JSON response with this EXACT structure (no additional text):
+{
+  "summary": "Brief 2-3 sentence overview",
+  "line_by_line": [
+    {
+      "line_number": 1,
+      "code": "actual code line",
+      "explanation": "clear explanation"
+    }
+  ],
+  "key_concepts": [
+    {
+      "concept": "Concept Name",
+      "explanation": "Why it matters"
+    }
+  ],
+  "complexity": {
+    "time": "O(n)",
+    "space": "O(1)",
+    "explanation": "Brief reasoning"
+  }
+}
+
+Level guidelines:
+- eli5: Use simple analogies (cookies, toys, games), no jargon
+- beginner: Clear explanations, define technical terms
+- intermediate: Assume basic programming knowledge
+- expert: Focus on performance, patterns, edge cases
+"""
+
+EXPLAIN_PROMPT_SUFFIX = """
+Explain this {language} code at a {level} level.
+
+CODE:
+```{language}
+{code}
+```
+"""
+
+BUGS_PROMPT_PREFIX = """Analyze the code given at the end of this prompt for bugs, issues, and improvements.
+
+Return JSON (no markdown):
+{
+  "bugs_found": [
+    {
+      "severity": "high|medium|low",
+      "line": 3,
+      "issue": "Brief description",
+      "explanation": "Why this is a problem",
+      "fix": "How to fix it"
+    }
+  ],
+  "code_smells": [
+    {
+      "type": "performance|readability|maintainability",
+      "line": 5,
+      "issue": "What's wrong",
+      "suggestion": "How to improve"
+    }
+  ],
+  "improvements": [
+    {
+      "category": "readability|performance|security",
+      "suggestion": "General improvement",
+      "example": "Code example if applicable"
+    }
+  ],
+  "refactored_code": "Improved version of the code (optional)"
+}
+
+Look for:
+- Syntax/logic errors
+- Performance issues
+- Security vulnerabilities
+- Missing error handling
+- Edge cases
+- Code smells
+- Best practices violations
+
+Return empty arrays if no issues found.
+"""
+
+BUGS_PROMPT_SUFFIX = """
+Analyze this {language} code.
+
+CODE:
+```{language}
+{code}
+```
+"""
+
+# Timestamps for health/error payloads, cached at 1-second granularity
+_ts_cache = ["", 0.0]
+
+def iso_now() -> str:
+    """Return the current UTC time as ISO string (refreshed at most once per second)"""
+    now = time.time()
+    if now - _ts_cache[1] >= 1.0:
+        _ts_cache[0] = datetime.utcfromtimestamp(now).isoformat()
+        _ts_cache[1] = now
+    return _ts_cache[0]
+
+
+# Response caching (in-memory, LRU eviction + TTL expiry)
 MAX_CACHE_SIZE = 100
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))  # seconds
+response_cache = TTLCache(maxsize=MAX_CACHE_SIZE, ttl=CACHE_TTL)
+
+# Visualizations are cheap to recompute compared to a Gemini call, so they get
+# their own smaller, shorter-lived cache and never evict AI responses
+VIZ_CACHE_SIZE = 50
+VIZ_CACHE_TTL = int(os.getenv("VIZ_CACHE_TTL", "600"))  # seconds
+viz_cache = TTLCache(maxsize=VIZ_CACHE_SIZE, ttl=VIZ_CACHE_TTL)
 
 def generate_cache_key(code: str, language: str, level: str = "") -> str:
-    """Generate cache key from request parameters"""
-    cache_string = f"{code}|{language}|{level}"
-    return hashlib.md5(cache_string.encode()).hexdigest()
+    """Generate cache key from request parameters (BLAKE2b-128, hashed incrementally)"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(code.encode())
+    h.update(b"|")
+    h.update(language.encode())
+    h.update(b"|")
+    h.update(level.encode())
+    return h.hexdigest()
+
+# Shared cache for multi-worker deployments (set in lifespan when REDIS_URL is configured)
+redis_client = None
+REDIS_KEY_PREFIX = "cs:"
+
+async def get_cached_response(cache_key: str, cache: TTLCache = response_cache):
+    """Get response from cache (Redis if configured, else the given in-memory TTLCache)"""
+    if redis_client is not None:
+        try:
+            raw = await redis_client.get(REDIS_KEY_PREFIX + cache_key)
+            return orjson.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning("⚠️ Redis cache read failed: %s", e)
+            return None
+    return cache.get(cache_key)
 
-def get_cached_response(cache_key: str):
-    """Get response from cache"""
-    return response_cache.get(cache_key)
+async def cache_response(cache_key: str, response_data: dict, cache: TTLCache = response_cache):
+    """Store response in cache; least recently used entry is evicted when full
 
-def cache_response(cache_key: str, response_data: dict):
-    """Store response in cache with size limit"""
-    if len(response_cache) >= MAX_CACHE_SIZE:
-        # Remove oldest entry (simple FIFO)
-        response_cache.pop(next(iter(response_cache)))
-    response_cache[cache_key] = response_data
+    With Redis the entry expires after the given cache's TTL.
+    """
+    if redis_client is not None:
+        try:
+            # Graph visualizations use int node ids as keys; serialize them as
+            # strings exactly like ORJSONResponse does
+            payload = orjson.dumps(response_data, option=orjson.OPT_NON_STR_KEYS)
+            await redis_client.set(REDIS_KEY_PREFIX + cache_key, payload, ex=int(cache.ttl))
+        except Exception as e:
+            logger.warning("⚠️ Redis cache write failed: %s", e)
+        return
+    cache[cache_key] = response_data
 
 # Pydantic models with validation
 class CodeRequest(BaseModel):
@@ -113,33 +309,38 @@ class CodeRequest(BaseModel):
     language: str
     level: str = "beginner"
 
-    @validator('code')
-    def validate_code(cls, v):
+    @field_validator('code')
+    @classmethod
+    def validate_code(cls, v: str) -> str:
         if not v.strip():
             raise ValueError('Code cannot be empty or whitespace only')
-        # Basic security checks
-        dangerous_patterns = ['__import__', 'eval(', 'exec(', 'compile(']
-        if any(pattern in v.lower() for pattern in dangerous_patterns):
+        # Basic security checks (single case-insensitive pass over the code)
+        if DANGEROUS_PATTERNS_RE.search(v):
             raise ValueError('Code contains potentially dangerous patterns')
         return v.strip()
 
-    @validator('language')
-    def validate_language(cls, v):
+    @field_validator('language')
+    @classmethod
+    def validate_language(cls, v: str) -> str:
         if v.lower() not in ALLOWED_LANGUAGES:
             raise ValueError(f'Language must be one of {ALLOWED_LANGUAGES}')
         return v.lower()
 
-    @validator('level')
-    def validate_level(cls, v):
+    @field_validator('level')
+    @classmethod
+    def validate_level(cls, v: str) -> str:
         if v.lower() not in ALLOWED_LEVELS:
             raise ValueError(f'Level must be one of {ALLOWED_LEVELS}')
         return v.lower()
 
-class ErrorResponse(BaseModel):
-    error: str
-    detail: Optional[str] = None
-    code: str
-    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+def require_python(code_request: CodeRequest) -> CodeRequest:
+    """Dependency for Python-only endpoints (language is already lower-cased by validation)"""
+    if code_request.language != "python":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Visualization only supports Python. Got: {code_request.language}"
+        )
+    return code_request
 
 # Custom rate limit exception handler
 @app.exception_handler(RateLimitExceeded)
@@ -158,14 +359,16 @@ async def custom_rate_limit_handler(request: Request, exc: RateLimitExceeded):
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.exception(f"Unhandled exception: {exc}")
+    logger.exception("Unhandled exception: %s", exc)
+    # Fixed-shape payload: build the dict directly (no model validation per error)
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content=ErrorResponse(
-            error="Internal server error",
-            detail=str(exc) if os.getenv("DEBUG", "false").lower() == "true" else "An unexpected error occurred",
-            code="INTERNAL_ERROR"
-        ).dict()
+        content={
+            "error": "Internal server error",
+            "detail": str(exc) if DEBUG else "An unexpected error occurred",
+            "code": "INTERNAL_ERROR",
+            "timestamp": iso_now()
+        }
     )
 
 @app.get("/")
@@ -190,12 +393,16 @@ async def root():
             "/health": "Health check",
             "/explain": "AI-powered code explanation",
             "/detect-bugs": "Bug detection and analysis",
+            "/explain/stream": "Streaming variant of /explain",
+            "/detect-bugs/stream": "Streaming variant of /detect-bugs",
             "/visualize": "Step-by-step execution visualization",
             "/cache/stats": "Cache statistics"
         },
         "rate_limits": {
             "/explain": "15 requests/minute",
             "/detect-bugs": "15 requests/minute",
+            "/explain/stream": "15 requests/minute",
+            "/detect-bugs/stream": "15 requests/minute",
             "/visualize": "15 requests/minute"
         },
         "supported_languages": ALLOWED_LANGUAGES
@@ -206,14 +413,15 @@ async def health_check():
     """Enhanced health check endpoint with service status"""
     health_status = {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": iso_now(),
         "version": "2.0.0",
         "services": {
             "api": "operational",
             "gemini_ai": "operational" if (API_KEY and client) else "unavailable",
             "code_analyzer": "operational",
             "universal_visualizer": "operational",
-            "cache": f"{len(response_cache)}/{MAX_CACHE_SIZE} items"
+            # In-memory counts mean nothing once responses live in Redis
+            "cache": "redis" if redis_client is not None else f"{len(response_cache)}/{MAX_CACHE_SIZE} items"
         },
         "configuration": {
             "max_code_length": MAX_CODE_LENGTH,
@@ -223,68 +431,126 @@ async def health_check():
     }
     
     # Log health check
-    logger.info(f"Health check performed - Gemini: {'✅' if (API_KEY and client) else '❌'}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Health check performed - Gemini: %s", '✅' if (API_KEY and client) else '❌')
     
     return health_status
 
 @app.get("/cache/stats")
 async def cache_stats():
-    """Get cache statistics"""
+    """Get cache statistics (in-memory counts; Redis manages its own capacity)"""
     return {
+        "backend": "redis" if redis_client is not None else "memory",
         "cached_responses": len(response_cache),
         "max_capacity": MAX_CACHE_SIZE,
         "utilization_percent": f"{(len(response_cache)/MAX_CACHE_SIZE)*100:.1f}%",
-        "status": "healthy" if len(response_cache) < MAX_CACHE_SIZE * 0.9 else "near_full"
+        "status": "healthy" if len(response_cache) < MAX_CACHE_SIZE * 0.9 else "near_full",
+        "cached_visualizations": len(viz_cache),
+        "max_visualizations": VIZ_CACHE_SIZE
     }
 
+MARKDOWN_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+# Either fence on its own, for responses cut off before the closing one
+MARKDOWN_FENCE_EDGE_RE = re.compile(r'^\s*```(?:json)?|```\s*$')
+
 def parse_ai_json_response(text: str) -> dict:
     """Safely parse JSON from AI response, handling markdown code blocks"""
     try:
-        text = text.strip()
-        if text.startswith("```json"):
-            text = text[7:]
-        elif text.startswith("```"):
-            text = text[3:]
-        
-        if text.endswith("```"):
-            text = text[:-3]
-        
-        return json.loads(text.strip())
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parse error: {e}")
-        logger.debug(f"Raw text (first 500 chars): {text[:500]}")
+        # One regex pass captures the body of a ```json fence; orjson itself
+        # skips surrounding whitespace, so unfenced text is parsed as-is
+        match = MARKDOWN_FENCE_RE.match(text)
+        if match:
+            return orjson.loads(match.group(1))
+        return orjson.loads(MARKDOWN_FENCE_EDGE_RE.sub('', text))
+    except orjson.JSONDecodeError as e:
+        logger.error("JSON parse error: %s", e)
+        logger.debug("Raw text (first 500 chars): %s", text[:500])
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to parse AI response: {str(e)}"
         )
 
+def gemini_config() -> types.GenerateContentConfig:
+    """Generation settings shared by the buffered and streaming Gemini calls"""
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=0),
+        response_mime_type="application/json",
+        temperature=0.2
+    )
+
 async def call_gemini_with_timeout(prompt: str, timeout: int = 60):
     """Call Gemini API with timeout protection"""
     try:
-        loop = asyncio.get_event_loop()
+        # Native async client: no worker thread is held while waiting on Gemini
         result = await asyncio.wait_for(
-            loop.run_in_executor(
-                None,
-                lambda: client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=prompt,
-                    config=types.GenerateContentConfig(
-                        thinking_config=types.ThinkingConfig(thinking_budget=0),
-                        response_mime_type="application/json",
-                        temperature=0.2
-                    )
-                )
+            client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=gemini_config()
             ),
             timeout=timeout
         )
         return result
     except asyncio.TimeoutError:
-        logger.error(f"AI request timed out after {timeout}s")
+        logger.error("AI request timed out after %ss", timeout)
         raise HTTPException(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail=f"AI service timeout after {timeout} seconds"
         )
 
+async def stream_gemini_and_cache(cache_key: str, prompt: str, timeout: int = 60):
+    """Yield Gemini's JSON text as it is generated, caching the parsed result at the end
+
+    The status line is already sent when streaming starts, so failures can
+    only end the stream early; the client then sees truncated JSON.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    chunks = []
+    try:
+        # Opening the stream counts against the same deadline as the chunks
+        stream = await asyncio.wait_for(
+            client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=gemini_config()
+            ),
+            timeout=deadline - loop.time()
+        )
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=deadline - loop.time())
+            except StopAsyncIteration:
+                break
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+    except asyncio.TimeoutError:
+        logger.error("AI stream timed out after %ss", timeout)
+        return
+    except Exception as e:
+        logger.exception("AI stream failed: %s", e)
+        return
+    
+    try:
+        await cache_response(cache_key, parse_ai_json_response("".join(chunks)))
+    except HTTPException:
+        pass  # unparseable output is not cached; already logged by the parser
+
+# In-flight AI calls keyed by cache key, so concurrent duplicate requests share one call
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def single_flight(cache_key: str, produce):
+    """Await produce() once per cache_key; concurrent callers with the same key share the result"""
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(produce())
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    # shield: one client disconnecting must not cancel the call for the others
+    return await asyncio.shield(task)
+
 @app.post("/explain")
 @limiter.limit("15/minute")
 async def explain_code(request: Request, code_request: CodeRequest):
@@ -299,54 +565,21 @@ async def explain_code(request: Request, code_request: CodeRequest):
     
     # Check cache first
     cache_key = generate_cache_key(code_request.code, code_request.language, code_request.level)
-    cached = get_cached_response(cache_key)
+    cached = await get_cached_response(cache_key)
     
     if cached:
-        logger.info(f"✅ Cache hit for {code_request.language} code")
+        logger.info("✅ Cache hit for %s code", code_request.language)
         return cached
     
-    logger.info(f"🔍 Explain request - Language: {code_request.language}, "
-                f"Level: {code_request.level}, Code length: {len(code_request.code)}")
+    logger.info("🔍 Explain request - Language: %s, Level: %s, Code length: %d",
+                code_request.language, code_request.level, len(code_request.code))
     
-    try:
-        start_time = time.time()
-        
-        prompt = f"""You are an expert coding instructor. Explain this {code_request.language} code at a {code_request.level} level.
-
-CODE:
-```{code_request.language}
-{code_request.code}
-```
-
-Return a JSON response with this EXACT structure (no additional text):
-{{
-  "summary": "Brief 2-3 sentence overview",
-  "line_by_line": [
-    {{
-      "line_number": 1,
-      "code": "actual code line",
-      "explanation": "clear explanation"
-    }}
-  ],
-  "key_concepts": [
-    {{
-      "concept": "Concept Name",
-      "explanation": "Why it matters"
-    }}
-  ],
-  "complexity": {{
-    "time": "O(n)",
-    "space": "O(1)",
-    "explanation": "Brief reasoning"
-  }}
-}}
-
-Level guidelines for {code_request.level}:
-- eli5: Use simple analogies (cookies, toys, games), no jargon
-- beginner: Clear explanations, define technical terms
-- intermediate: Assume basic programming knowledge
-- expert: Focus on performance, patterns, edge cases
-"""
+    async def generate_explanation():
+        prompt = EXPLAIN_PROMPT_PREFIX + EXPLAIN_PROMPT_SUFFIX.format(
+            language=code_request.language,
+            level=code_request.level,
+            code=code_request.code
+        )
 
         logger.debug("Calling Gemini API with timeout...")
         response = await call_gemini_with_timeout(prompt, timeout=60)
@@ -355,17 +588,24 @@ Level guidelines for {code_request.level}:
         explanation = parse_ai_json_response(response.text)
         
         # Cache the response
-        cache_response(cache_key, explanation)
+        await cache_response(cache_key, explanation)
+        return explanation
+    
+    try:
+        start_time = time.perf_counter_ns()
         
-        elapsed = time.time() - start_time
-        logger.info(f"✅ Successfully generated explanation in {elapsed:.2f}s and cached")
+        explanation = await single_flight(cache_key, generate_explanation)
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("✅ Successfully generated explanation in %.2fs and cached",
+                        (time.perf_counter_ns() - start_time) / 1e9)
         
         return explanation
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception(f"Error explaining code: {e}")
+        logger.exception("Error explaining code: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to explain code: {str(e)}"
@@ -384,154 +624,201 @@ async def detect_bugs(request: Request, code_request: CodeRequest):
     
     # Check cache first
     cache_key = generate_cache_key(code_request.code, code_request.language, "bugs")
-    cached = get_cached_response(cache_key)
+    cached = await get_cached_response(cache_key)
     
     if cached:
-        logger.info(f"✅ Cache hit for bug detection")
+        logger.info("✅ Cache hit for bug detection")
         return cached
     
-    logger.info(f"🐛 Bug detection request - Language: {code_request.language}")
+    logger.info("🐛 Bug detection request - Language: %s", code_request.language)
     
-    try:
-        start_time = time.time()
-        
-        prompt = f"""Analyze this {code_request.language} code for bugs, issues, and improvements.
-
-CODE:
-```{code_request.language}
-{code_request.code}
-```
-
-Return JSON (no markdown):
-{{
-  "bugs_found": [
-    {{
-      "severity": "high|medium|low",
-      "line": 3,
-      "issue": "Brief description",
-      "explanation": "Why this is a problem",
-      "fix": "How to fix it"
-    }}
-  ],
-  "code_smells": [
-    {{
-      "type": "performance|readability|maintainability",
-      "line": 5,
-      "issue": "What's wrong",
-      "suggestion": "How to improve"
-    }}
-  ],
-  "improvements": [
-    {{
-      "category": "readability|performance|security",
-      "suggestion": "General improvement",
-      "example": "Code example if applicable"
-    }}
-  ],
-  "refactored_code": "Improved version of the code (optional)"
-}}
-
-Look for:
-- Syntax/logic errors
-- Performance issues
-- Security vulnerabilities
-- Missing error handling
-- Edge cases
-- Code smells
-- Best practices violations
-
-Return empty arrays if no issues found.
-"""
+    async def generate_bug_analysis():
+        prompt = BUGS_PROMPT_PREFIX + BUGS_PROMPT_SUFFIX.format(
+            language=code_request.language,
+            code=code_request.code
+        )
 
         logger.debug("Calling Gemini API for bug detection...")
         response = await call_gemini_with_timeout(prompt, timeout=60)
         bug_analysis = parse_ai_json_response(response.text)
         
         # Cache the response
-        cache_response(cache_key, bug_analysis)
+        await cache_response(cache_key, bug_analysis)
+        return bug_analysis
+    
+    try:
+        start_time = time.perf_counter_ns()
         
-        elapsed = time.time() - start_time
-        logger.info(f"✅ Bug analysis complete in {elapsed:.2f}s and cached")
+        bug_analysis = await single_flight(cache_key, generate_bug_analysis)
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("✅ Bug analysis complete in %.2fs and cached",
+                        (time.perf_counter_ns() - start_time) / 1e9)
         
         return bug_analysis
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception(f"Error detecting bugs: {e}")
+        logger.exception("Error detecting bugs: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to analyze bugs: {str(e)}"
         )
 
+@app.post("/explain/stream")
+@limiter.limit("15/minute")
+async def explain_code_stream(request: Request, code_request: CodeRequest):
+    """Same as /explain, but streams the JSON as Gemini generates it"""
+    
+    if not API_KEY or not client:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI service not configured. Please set GEMINI_API_KEY in environment."
+        )
+    
+    # Shares cache entries with /explain
+    cache_key = generate_cache_key(code_request.code, code_request.language, code_request.level)
+    cached = await get_cached_response(cache_key)
+    
+    if cached:
+        logger.info("✅ Cache hit for %s code (stream)", code_request.language)
+        return StreamingResponse(iter([orjson.dumps(cached)]), media_type="application/json")
+    
+    logger.info("🔍 Streaming explain request - Language: %s, Level: %s, Code length: %d",
+                code_request.language, code_request.level, len(code_request.code))
+    
+    prompt = EXPLAIN_PROMPT_PREFIX + EXPLAIN_PROMPT_SUFFIX.format(
+        language=code_request.language,
+        level=code_request.level,
+        code=code_request.code
+    )
+    return StreamingResponse(
+        stream_gemini_and_cache(cache_key, prompt),
+        media_type="application/json"
+    )
+
+@app.post("/detect-bugs/stream")
+@limiter.limit("15/minute")
+async def detect_bugs_stream(request: Request, code_request: CodeRequest):
+    """Same as /detect-bugs, but streams the JSON as Gemini generates it"""
+    
+    if not API_KEY or not client:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI service not configured. Please set GEMINI_API_KEY in environment."
+        )
+    
+    # Shares cache entries with /detect-bugs
+    cache_key = generate_cache_key(code_request.code, code_request.language, "bugs")
+    cached = await get_cached_response(cache_key)
+    
+    if cached:
+        logger.info("✅ Cache hit for bug detection (stream)")
+        return StreamingResponse(iter([orjson.dumps(cached)]), media_type="application/json")
+    
+    logger.info("🐛 Streaming bug detection request - Language: %s", code_request.language)
+    
+    prompt = BUGS_PROMPT_PREFIX + BUGS_PROMPT_SUFFIX.format(
+        language=code_request.language,
+        code=code_request.code
+    )
+    return StreamingResponse(
+        stream_gemini_and_cache(cache_key, prompt),
+        media_type="application/json"
+    )
+
+TRIVIAL_CODE_LENGTH = 64  # code_analyzer cost grows steeply with input size
+
+def _is_trivial(code: str) -> bool:
+    """Short, at most two lines and no loops/functions (static analysis is near-instant)"""
+    return (
+        len(code) < TRIVIAL_CODE_LENGTH
+        and code.count('\n') < 2
+        and all(kw not in code for kw in ('for ', 'while ', 'def '))
+    )
+
 @app.post("/visualize")
 @limiter.limit("15/minute")
-async def visualize_code(request: Request, code_request: CodeRequest):
+async def visualize_code(request: Request, code_request: CodeRequest = Depends(require_python)):
     """
     ✅ FIXED: Use code_analyzer as PRIMARY (supports stacks correctly!)
     Fall back to universal_visualizer only if code_analyzer fails
     """
     
-    logger.info(f"🎬 Visualization request - Language: {code_request.language}")
+    logger.info("🎬 Visualization request - Language: %s", code_request.language)
     
-    if code_request.language.lower() != 'python':
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Visualization only supports Python. Got: {code_request.language}"
-        )
+    # Check cache first (tracing is deterministic for the same snippet)
+    cache_key = generate_cache_key(code_request.code, "python", "viz")
+    cached = await get_cached_response(cache_key, viz_cache)
+    
+    if cached:
+        logger.info("✅ Cache hit for visualization")
+        return cached
+    
+    loop = asyncio.get_running_loop()
     
     try:
-        # ✅ ALWAYS try code_analyzer FIRST (it handles stacks, arrays, graphs correctly!)
+        # ✅ Try code_analyzer FIRST (it handles stacks, arrays, graphs correctly!)
         logger.info("🔍 Attempting static analysis with code_analyzer...")
         
         try:
-            static_steps = generate_execution_steps(code_request.code, code_request.language)
-            
+            if _is_trivial(code_request.code):
+                # Static analysis of a line or two is cheaper than the thread hop
+                static_steps = generate_execution_steps(code_request.code, code_request.language)
+            else:
+                static_steps = await loop.run_in_executor(
+                    VIZ_EXECUTOR, generate_execution_steps, code_request.code, code_request.language
+                )
+        
             # ✅ Use code_analyzer if it generated ANY valid steps (not just errors)
             if static_steps and len(static_steps) > 0:
                 first_step = static_steps[0]
                 viz_type = first_step.get('visualization', {}).get('type', 'none')
-                
-                logger.info(f"📊 code_analyzer detected type: {viz_type}")
-                
+            
+                logger.info("📊 code_analyzer detected type: %s", viz_type)
+            
                 # ✅ CRITICAL FIX: Accept ANY type except 'none' and 'error'
                 # This includes: 'stack', 'array', 'queue', 'graph', 'dict', etc.
                 if viz_type not in ['none', 'error']:
-                    logger.info(f"✅ Using code_analyzer (detected {viz_type} with {len(static_steps)} steps)")
-                    return {
+                    logger.info("✅ Using code_analyzer (detected %s with %d steps)", viz_type, len(static_steps))
+                    visualization = {
                         "success": True,
                         "steps": static_steps,
                         "total_steps": len(static_steps),
                         "language": code_request.language,
                         "analyzer": "code_analyzer"
                     }
+                    await cache_response(cache_key, visualization, viz_cache)
+                    return visualization
                 else:
-                    logger.info(f"⚠️ code_analyzer returned {viz_type}, trying universal_visualizer...")
+                    logger.info("⚠️ code_analyzer returned %s, trying universal_visualizer...", viz_type)
             else:
                 logger.warning("⚠️ code_analyzer returned empty steps")
-                
+            
         except Exception as e:
-            logger.warning(f"⚠️ code_analyzer failed: {e}")
-            import traceback
+            logger.warning("⚠️ code_analyzer failed: %s", e)
             logger.debug("Full traceback:")
             logger.debug(traceback.format_exc())
-        
+
         # Fall back to universal_visualizer only if code_analyzer failed or returned none/error
         logger.info("🔄 Falling back to universal_visualizer...")
         tracer = UniversalCodeTracer(code_request.code)
-        result = tracer.execute(max_steps=100)
+        result = await loop.run_in_executor(VIZ_EXECUTOR, tracer.execute, 100)
         
         if result['success']:
-            logger.info(f"✅ Generated {result['total_steps']} steps (universal_visualizer)")
-            return {
+            logger.info("✅ Generated %s steps (universal_visualizer)", result['total_steps'])
+            visualization = {
                 "success": True,
                 "steps": result['steps'],
                 "total_steps": result['total_steps'],
                 "language": code_request.language,
                 "analyzer": "universal_visualizer"
             }
+            await cache_response(cache_key, visualization, viz_cache)
+            return visualization
         else:
-            logger.warning(f"⚠️ Partial execution: {result.get('error', 'Unknown error')}")
+            logger.warning("⚠️ Partial execution: %s", result.get('error', 'Unknown error'))
             return {
                 "success": False,
                 "steps": result.get('steps', []),
@@ -543,7 +830,7 @@ async def visualize_code(request: Request, code_request: CodeRequest):
             }
         
     except Exception as e:
-        logger.exception(f"❌ Visualization error: {e}")
+        logger.exception("❌ Visualization error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Visualization failed: {str(e)}"
@@ -553,19 +840,28 @@ if __name__ == "__main__":
     import uvicorn
     
     port = int(os.getenv("PORT", "8000"))
-    debug = os.getenv("DEBUG", "false").lower() == "true"
+    debug = DEBUG
+    # reload only works with a single worker
+    workers = None if debug else int(
+        os.getenv("WORKERS") or os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 2
+    )
     
-    logger.info(f"🚀 Starting CodeSense AI API on port {port}")
-    logger.info(f"🔧 Debug mode: {debug}")
-    logger.info(f"🌐 Allowed origins: {ALLOWED_ORIGINS}")
-    logger.info(f"💾 Cache enabled: {MAX_CACHE_SIZE} items max")
-    logger.info(f"🎨 Visualizers: code_analyzer (PRIMARY) + universal_visualizer (FALLBACK)")
-    logger.info(f"📚 Stack support: ✅ ENABLED via code_analyzer")
+    logger.info("🚀 Starting CodeSense AI API on port %s", port)
+    logger.info("🔧 Debug mode: %s", debug)
+    logger.info("👷 Workers: %s", workers or 1)
+    logger.info("🌐 Allowed origins: %s", ALLOWED_ORIGINS)
+    logger.info("💾 Cache enabled: %s items max (+ %s visualizations)", MAX_CACHE_SIZE, VIZ_CACHE_SIZE)
+    logger.info("🎨 Visualizers: code_analyzer (PRIMARY) + universal_visualizer (FALLBACK)")
+    logger.info("📚 Stack support: ✅ ENABLED via code_analyzer")
     
+    # Import string form is required for workers/reload
     uvicorn.run(
-        app, 
-        host="0.0.0.0", 
+        "main:app",
+        host="0.0.0.0",
         port=port,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows build
+        http="httptools",
+        workers=workers,
         reload=debug,
         log_level="info"
     )
\ No newline at end of file
@@ -0,0 +1,15 @@
+"""Shared pytest fixtures"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient for the whole run (lifespan startup/shutdown runs once)"""
+    from main import app
+    with TestClient(app) as c:
+        yield c
@@ -1,35 +1,25 @@
-"""Simple tests for API endpoints"""
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+"""Simple tests for API endpoints (client fixture lives in conftest.py)"""
+import asyncio
 
-from fastapi.testclient import TestClient
-from main import app
 
-# Fix: Don't create client globally, create it in each test
-# OR use the correct import
-
-def test_root_endpoint():
+def test_root_endpoint(client):
     """Test root endpoint"""
-    client = TestClient(app=app)
     response = client.get("/")
     assert response.status_code == 200
     data = response.json()
     assert "message" in data
 
 
-def test_health_check():
+def test_health_check(client):
     """Test health check"""
-    client = TestClient(app=app)
     response = client.get("/health")
     assert response.status_code == 200
     data = response.json()
     assert "status" in data
 
 
-def test_visualize_array():
+def test_visualize_array(client):
     """Test visualization endpoint"""
-    client = TestClient(app=app)
     payload = {
         "code": "arr = [1, 2, 3]",
         "language": "python"
@@ -40,9 +30,8 @@ def test_visualize_array():
     assert "steps" in data
 
 
-def test_visualize_requires_python():
+def test_visualize_requires_python(client):
     """Test that non-Python is rejected"""
-    client = TestClient(app=app)
     payload = {
         "code": "console.log('test')",
         "language": "javascript"
@@ -51,13 +40,76 @@ def test_visualize_requires_python():
     assert response.status_code == 400
 
 
-def test_explain_validation():
+def test_explain_validation(client):
     """Test explain endpoint validation"""
-    client = TestClient(app=app)
     payload = {
         "code": "   ",  # Empty whitespace
         "language": "python",
         "level": "beginner"
     }
     response = client.post("/explain", json=payload)
-    assert response.status_code == 422  # Validation error
\ No newline at end of file
+    assert response.status_code == 422  # Validation error
+
+
+def test_explain_stream_validation(client):
+    """Test streaming explain endpoint validation"""
+    payload = {
+        "code": "   ",  # Empty whitespace
+        "language": "python",
+        "level": "beginner"
+    }
+    response = client.post("/explain/stream", json=payload)
+    assert response.status_code == 422  # Validation error
+
+
+def test_single_flight_shares_one_call():
+    """Test concurrent callers with the same key run produce() once"""
+    from main import single_flight, _inflight
+    calls = 0
+    
+    async def produce():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"summary": "ok"}
+    
+    async def run():
+        return await asyncio.gather(single_flight("k", produce), single_flight("k", produce))
+    
+    first, second = asyncio.run(run())
+    assert calls == 1
+    assert first == {"summary": "ok"}
+    assert second is first
+    assert not _inflight
+
+
+def test_single_flight_shares_errors():
+    """Test an exception from produce() reaches every waiting caller"""
+    from main import single_flight, _inflight
+    calls = 0
+    
+    async def produce():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+    
+    async def run():
+        return await asyncio.gather(
+            single_flight("k", produce), single_flight("k", produce), return_exceptions=True
+        )
+    
+    results = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+    assert not _inflight
+
+
+def test_parse_ai_json_fence_variants():
+    """Test AI JSON parses with both, either or no markdown fences"""
+    from main import parse_ai_json_response
+    expected = {"bugs": []}
+    assert parse_ai_json_response('```json\n{"bugs": []}\n```') == expected
+    assert parse_ai_json_response('```json\n{"bugs": []}') == expected  # cut off
+    assert parse_ai_json_response('{"bugs": []}\n```') == expected
+    assert parse_ai_json_response('{"bugs": []}') == expected
@@ -0,0 +1,140 @@
+"""Simple tests for universal_visualizer.py"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from universal_visualizer import SNAPSHOT_CAP, UniversalCodeTracer
+
+BUBBLE_SORT = """
+arr = [3, 1, 2]
+n = len(arr)
+for i in range(n):
+    for j in range(0, n-i-1):
+        if arr[j] > arr[j+1]:
+            arr[j], arr[j+1] = arr[j+1], arr[j]
+"""
+
+
+def test_bubble_sort_steps():
+    """Test sorting produces array snapshots that track the swaps"""
+    result = UniversalCodeTracer(BUBBLE_SORT).execute(max_steps=100)
+    
+    assert result['success']
+    arrays = [s['visualization'] for s in result['steps'] if s['visualization']['type'] == 'array']
+    assert arrays[0]['data'] == [3, 1, 2]
+    assert arrays[-1]['data'] == [1, 2, 3]
+
+
+def test_bfs_detection():
+    """Test graph + queue + visited is shown as BFS"""
+    code = "graph = {'A': ['B'], 'B': []}\nvisited = set()\nqueue = deque(['A'])\nnode = queue.popleft()"
+    result = UniversalCodeTracer(code).execute(max_steps=100)
+    
+    assert result['success']
+    assert result['steps'][-1]['visualization']['type'] == 'graph_with_ds'
+
+
+def test_function_calls_are_traced():
+    """Test lines inside user functions are traced with their locals"""
+    code = "def double(a):\n    b = a * 2\n    return b\n\nx = double(4)"
+    result = UniversalCodeTracer(code).execute(max_steps=100)
+    
+    assert [s['line'] for s in result['steps']] == [1, 5, 2, 3]
+
+
+def test_max_steps_truncation():
+    """Test long executions are capped"""
+    code = "total = 0\nfor k in range(1000):\n    total += k"
+    result = UniversalCodeTracer(code).execute(max_steps=10)
+    
+    assert result['success']
+    assert result['total_steps'] == 11
+    assert result['steps'][-1]['code'] == '...'
+
+
+def test_infinite_loop_stops_at_max_steps():
+    """Test tracing aborts once the step budget is spent"""
+    code = "x = 0\nwhile True:\n    x += 1"
+    result = UniversalCodeTracer(code, max_steps=20).execute()
+    
+    assert result['success']
+    assert result['total_steps'] == 21
+
+
+def test_nested_list_snapshots_are_per_step():
+    """Test rows mutated in place show their state at each step"""
+    code = "grid = [[0, 0], [0, 0]]\nfor i in range(2):\n    grid[i][i] = 1\nx = 0"
+    result = UniversalCodeTracer(code).execute()
+    
+    grids = [s['visualization'].get('data') for s in result['steps']]
+    assert [[0, 0], [0, 0]] in grids
+    assert [[1, 0], [0, 0]] in grids
+    assert grids[-1] == [[1, 0], [0, 1]]
+
+
+def test_equal_values_of_other_types_are_not_merged():
+    """Test [1, 2] and [1.0, 2.0] snapshots stay distinct"""
+    code = "arr = [1, 2]\narr = [1.0, 2.0]\nx = 1"
+    result = UniversalCodeTracer(code).execute()
+    
+    data = result['steps'][-1]['visualization']['data']
+    assert [type(v) for v in data] == [float, float]
+
+
+def test_step_after_pure_line_reuses_visualization():
+    """Test the step after `if x:` / `pass` reuses the previous visualization"""
+    class CountingTracer(UniversalCodeTracer):
+        calls = 0
+        
+        def detect_and_visualize(self):
+            self.calls += 1
+            return super().detect_and_visualize()
+    
+    tracer = CountingTracer("x = 1\nif x:\n    pass\ny = 2")
+    steps = tracer.execute()['steps']
+    
+    assert [s['line'] for s in steps] == [1, 2, 3, 4]
+    assert tracer.calls == 2
+    assert steps[2]['visualization'] is steps[1]['visualization']
+
+
+def test_subscript_test_is_not_treated_as_pure():
+    """Test a defaultdict lookup in an if-test is visible on the next step"""
+    code = ("from collections import defaultdict\ncounts = defaultdict(int)\n"
+            "if counts['a'] > 1:\n    pass\nx = 1")
+    result = UniversalCodeTracer(code).execute()
+    
+    assert result['steps'][-1]['visualization']['data'] == {'a': 0}
+
+
+def test_large_queue_snapshot_is_capped():
+    """Test big containers are cut to SNAPSHOT_CAP items and flagged"""
+    code = "queue = deque(range(100))\nx = 1"
+    result = UniversalCodeTracer(code).execute()
+    
+    viz = result['steps'][-1]['visualization']
+    assert viz['type'] == 'queue'
+    assert len(viz['data']) == SNAPSHOT_CAP
+    assert viz['truncated']
+
+
+def test_large_stack_snapshot_keeps_top():
+    """Test a capped DFS stack still shows (and highlights) its top"""
+    code = ("graph = {0: [1]}\nvisited = set()\nstack = list(range(100))\n"
+            "node = stack.pop()\nx = 1")
+    result = UniversalCodeTracer(code).execute()
+    
+    ds = result['steps'][-1]['visualization']['data_structure']
+    assert len(ds['data']) == SNAPSHOT_CAP
+    assert ds['data'][-1] == 98
+    assert ds['data'][ds['highlight'][0]] == 98
+    assert ds['truncated']
+
+
+def test_runtime_error_returns_partial_steps():
+    """Test runtime errors are reported with the steps traced so far"""
+    result = UniversalCodeTracer("x = 1\ny = x / 0").execute(max_steps=100)
+    
+    assert not result['success']
+    assert 'division by zero' in result['error']
+    assert len(result['steps']) == 2
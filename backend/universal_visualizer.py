@@ -4,83 +4,362 @@ Fixed Universal Code Visualizer - CORRECTED Line Numbers & Array Cloning
 
 import sys
 import ast
+import math
 import json
+import threading
 import traceback
-from typing import Any, Dict, List
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from collections import deque
-import copy  # ADDED: For deep copying arrays
+from itertools import islice
+import copy  # Snapshots of mutable values embedded in steps
+
+
+# ==================== LINE EVENT SOURCE ====================
+# CPython 3.12+ has PEP 669 sys.monitoring: LINE events are enabled only on the
+# user's code objects, so frames outside the snippet never reach Python code.
+# One tool id is shared by every tracer (tracers may run concurrently in a
+# thread pool); callbacks are routed to the owning tracer by code object.
+# Older interpreters fall back to sys.settrace, which gives frames outside the
+# snippet no local trace function so their lines are never reported.
+
+_monitoring = getattr(sys, 'monitoring', None)
+_MONITOR_TOOL_NAME = 'codesense-viz'
+_VIZ_FILENAME = '<viz>'
+_monitor_lock = threading.Lock()
+_monitor_tool_id = None
+# Keyed by id(): code objects compare by value, so two tracers running the
+# same snippet concurrently would otherwise share an entry
+_monitored_code: Dict[int, 'UniversalCodeTracer'] = {}
+
+
+def _monitor_on_line(code, line_number):
+    tracer = _monitored_code.get(id(code))
+    if tracer is None:
+        return _monitoring.DISABLE
+    return tracer.on_monitor_line(sys._getframe(1))
+
+
+def _monitor_on_start(code, instruction_offset):
+    tracer = _monitored_code.get(id(code))
+    if tracer is not None:
+        tracer.on_call(code)
+
+
+def _monitor_on_return(code, instruction_offset, retval):
+    tracer = _monitored_code.get(id(code))
+    if tracer is not None:
+        tracer.on_return()
+
+
+def _claim_monitor_tool_id():
+    """Claim a free sys.monitoring tool id once per process (None if unavailable)"""
+    global _monitor_tool_id
+    if _monitor_tool_id is not None or _monitoring is None:
+        return _monitor_tool_id
+    
+    # 0-2 and 5 are reserved for debuggers, coverage, profilers and optimizers
+    for tool_id in (3, 4):
+        if _monitoring.get_tool(tool_id) is None:
+            _monitoring.use_tool_id(tool_id, _MONITOR_TOOL_NAME)
+            events = _monitoring.events
+            _monitoring.register_callback(tool_id, events.LINE, _monitor_on_line)
+            _monitoring.register_callback(tool_id, events.PY_START, _monitor_on_start)
+            _monitoring.register_callback(tool_id, events.PY_RETURN, _monitor_on_return)
+            _monitor_tool_id = tool_id
+            break
+    return _monitor_tool_id
+
+
+def _collect_code_objects(code) -> List:
+    """The module code object plus every nested function/class body"""
+    found = [code]
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            found.extend(_collect_code_objects(const))
+    return found
+
+
+class _StepLimitReached(BaseException):
+    """Raised from the line callback to stop the traced program at max_steps.
+
+    BaseException so user code's ``except Exception`` cannot swallow it.
+    """
+
+
+class LinePlan(NamedTuple):
+    """Static facts about one source line, computed once per tracer"""
+    code: Optional[str]      # stripped source; None if the line never produces a step
+    template: Optional[str]  # description; {0} = probed value, {1} = value + 1
+    fallback: str            # description when there is no template or the probe is unset
+    probe: Optional[str]     # variable read to fill the template
+
+
+# Containers shown per step (queue, stack, visited, graph nodes) are cut to this
+# many items (stacks keep their top end); the UI cannot draw more and copying
+# the rest on every line is waste
+SNAPSHOT_CAP = 64
+
+# Element types that can be shared between step snapshots; anything else
+# (nested lists, dicts, objects) may change later and is deep-copied
+_ATOMIC_TYPES = frozenset({int, float, complex, bool, str, bytes, type(None)})
+
+# Circle layouts by node count; only the node labels differ between graphs
+_POS_TABLE: Dict[int, List[Tuple[int, int]]] = {}
+
+
+def _circle_layout(n: int) -> List[Tuple[int, int]]:
+    """(x, y) for n nodes spaced evenly on a circle, first node at the top"""
+    table = _POS_TABLE.get(n)
+    if table is None:
+        radius = 180
+        center_x, center_y = 400, 250
+        table = []
+        for i in range(n):
+            angle = 2 * math.pi * i / n - math.pi / 2
+            table.append((int(center_x + radius * math.cos(angle)),
+                          int(center_y + radius * math.sin(angle))))
+        _POS_TABLE[n] = table
+    return table
+
+
+# The only expression nodes allowed in a pure line. Subscripts, attributes and
+# comparisons are left out: defaultdict lookups insert keys, and user
+# __getitem__/__eq__/properties can change anything. Truth tests of plain
+# names (`while queue:`) stay pure; a __bool__ defined in the snippet is
+# traced in its own frame, which already ends the reuse.
+_PURE_EXPR_NODES = (
+    ast.Name, ast.Constant, ast.BoolOp, ast.UnaryOp,
+    ast.Load, ast.And, ast.Or, ast.Not, ast.UAdd, ast.USub, ast.Invert,
+)
+
+
+def _is_pure_stmt(node: ast.stmt) -> bool:
+    """True for statements whose own line cannot change any variable"""
+    if isinstance(node, (ast.Pass, ast.Break, ast.Continue)):
+        return True
+    if isinstance(node, (ast.If, ast.While)):
+        expr = node.test  # only the header runs on this line
+    elif isinstance(node, ast.Expr):
+        expr = node.value
+    else:
+        return False
+    return all(isinstance(n, _PURE_EXPR_NODES) for n in ast.walk(expr))
+
+
+def _strict_eq(a, b) -> bool:
+    """Equality that also requires matching types, so 1, 1.0 and True differ"""
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return len(a) == len(b) and all(
+            type(ka) is type(kb) and ka == kb and _strict_eq(va, vb)
+            for (ka, va), (kb, vb) in zip(a.items(), b.items())
+        )
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(map(_strict_eq, a, b))
+    return a == b
+
+
+def _bound_names(tree: ast.AST) -> List[str]:
+    """Names the snippet binds (assignments, loop targets, parameters, imports)
+    in source order, without private ``_`` names"""
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            found.append((node.lineno, node.col_offset, node.id))
+        elif isinstance(node, ast.arg):
+            found.append((node.lineno, node.col_offset, node.arg))
+        elif isinstance(node, ast.alias) and node.name != '*':
+            name = (node.asname or node.name).split('.')[0]
+            found.append((node.lineno, node.col_offset, name))
+    found.sort()
+    return list(dict.fromkeys(name for _, _, name in found if not name.startswith('_')))
 
 
 class UniversalCodeTracer:
     """Traces any Python code execution and generates visualization steps"""
     
-    def __init__(self, code: str):
+    def __init__(self, code: str, max_steps: int = 100):
         self.code = code
+        self._max_steps = max_steps
+        self._limit_reached = False
+        # Split and strip the source once; line events only index into this
+        self._stripped_lines = [line.strip() for line in code.split('\n')]
+        self._line_plans: Dict[int, LinePlan] = {}
+        # Lines like `if arr[j] > arr[j+1]:` or `while queue:` change nothing,
+        # so the step after one (in the same frame) reuses its visualization
+        self._pure_lines = set()
+        self._pure_frame = None
+        # Only names the snippet binds can be worth showing; scanning these in
+        # source order replaces walking every entry of f_locals on each step
+        self._var_names: List[str] = []
+        self._array_names: List[str] = []
+        self._sort_names: List[str] = []
+        self._plan_statements()
+        # Filled in place up to _w; execute() sizes it to max_steps and trims
         self.steps = []
+        self._w = 0
         self.current_line = 0
+        self._frame = None
         self.local_vars = {}
-        self.previous_vars = {}
         self.call_stack = []
         self.step_count = 0
         self.initial_setup_complete = False
+        # Consecutive identical visualizations share one dict, and equal
+        # array snapshots share one list (sorting repeats the same arrays a lot)
+        self._last_viz = None
+        self._list_intern: Dict[Tuple[tuple, tuple], list] = {}
+        # Formatted descriptions repeat across iterations ("... (j = 0)")
+        self._desc_intern: Dict[str, str] = {}
+        # Graph layouts by node tuple; the graph rarely changes between steps
+        self._pos_cache: Dict[tuple, Dict] = {}
+        # id(dict) -> (dict, deep copy, formatted lines) from the last step it
+        # was shown; the dict is held so its id cannot be reused meanwhile
+        self._fmt_cache: Dict[int, Tuple[dict, dict, List[str]]] = {}
         
     def trace_execution(self, frame, event, arg):
-        """Trace callback for sys.settrace"""
+        """Trace callback for sys.settrace (used when sys.monitoring is unavailable)"""
         if event == 'line':
-            self.current_line = frame.f_lineno
-            # FIX 1: Deep copy local vars to prevent mutation issues
-            self.local_vars = copy.deepcopy(frame.f_locals)
-            
-            # Get the actual code line
-            code_lines = self.code.split('\n')
-            if 0 <= self.current_line - 1 < len(code_lines):
-                code_line = code_lines[self.current_line - 1].strip()
-            else:
-                code_line = ""
-            
-            self.step_count += 1
-            
-            # FIXED: Only skip comments and empty lines, NOT variable setup
-            if not code_line or code_line.startswith('#'):
-                self.previous_vars = copy.deepcopy(self.local_vars)
-                return self.trace_execution
-            
-            # FIXED: Track initial array setup
-            if 'arr' in self.local_vars and not self.initial_setup_complete:
-                self.initial_setup_complete = True
-                # Force showing the initial array
-                step = {
-                    'line': self.current_line,  # ✅ Using actual frame line number
-                    'code': code_line,
-                    'description': 'Initial array created',
-                    'visualization': self.detect_and_visualize()
-                }
-                self.steps.append(step)
-                self.previous_vars = copy.deepcopy(self.local_vars)
-                return self.trace_execution
-            
-            # Generate visualization for current state
-            step = {
-                'line': self.current_line,  # ✅ Using actual frame line number
-                'code': code_line,
-                'description': self.generate_description(code_line),
-                'visualization': self.detect_and_visualize()
-            }
-            
-            self.steps.append(step)
-            self.previous_vars = copy.deepcopy(self.local_vars)
-            
+            self.record_line(frame)
         elif event == 'call':
-            func_name = frame.f_code.co_name
-            if func_name not in ['<module>', '<listcomp>', '<dictcomp>']:
-                self.call_stack.append(func_name)
-                
+            if frame.f_code.co_filename != _VIZ_FILENAME:
+                # Library frame: no line/return events for it or its lines
+                return None
+            self.on_call(frame.f_code)
         elif event == 'return':
-            if self.call_stack:
-                self.call_stack.pop()
+            self.on_return()
         
         return self.trace_execution
     
+    def on_monitor_line(self, frame):
+        """sys.monitoring LINE callback body"""
+        if not self.record_line(frame):
+            # Blank/comment lines never produce a step: stop reporting this line
+            return _monitoring.DISABLE
+        return None
+    
+    def on_call(self, code):
+        func_name = code.co_name
+        if func_name not in ['<module>', '<listcomp>', '<dictcomp>']:
+            self.call_stack.append(func_name)
+    
+    def on_return(self):
+        if self.call_stack:
+            self.call_stack.pop()
+    
+    def record_line(self, frame) -> bool:
+        """Record a step for the line about to execute; False if the line is skipped"""
+        self.current_line = frame.f_lineno
+        # Live view of the frame's locals, read once per line (no per-line copy).
+        # Visualizers snapshot only the values they embed in a step.
+        self._frame = frame
+        self.local_vars = frame.f_locals
+        
+        # One dict lookup replaces re-splitting the source and matching patterns
+        plan = self._line_plans.get(self.current_line)
+        if plan is None:
+            plan = self._line_plans[self.current_line] = self._plan_line(self.current_line)
+        
+        self.step_count += 1
+        
+        # FIXED: Only skip comments and empty lines, NOT variable setup
+        if plan.code is None:
+            return False
+        
+        # Stop the program as soon as the step budget is spent instead of
+        # tracing it to completion and throwing the extra steps away
+        if self._w >= self._max_steps:
+            self._limit_reached = True
+            raise _StepLimitReached
+        
+        # FIXED: Track initial array setup
+        if 'arr' in self.local_vars and not self.initial_setup_complete:
+            self.initial_setup_complete = True
+            # Force showing the initial array
+            step = {
+                'line': self.current_line,  # ✅ Using actual frame line number
+                'code': plan.code,
+                'description': 'Initial array created',
+                'visualization': self._step_viz(frame)
+            }
+            self.steps[self._w] = step
+            self._w += 1
+            self._pure_frame = frame if self.current_line in self._pure_lines else None
+            return True
+        
+        # Generate visualization for current state
+        step = {
+            'line': self.current_line,  # ✅ Using actual frame line number
+            'code': plan.code,
+            'description': self.generate_description(plan),
+            'visualization': self._step_viz(frame)
+        }
+        
+        self.steps[self._w] = step
+        self._w += 1
+        self._pure_frame = frame if self.current_line in self._pure_lines else None
+        return True
+    
+    def _step_viz(self, frame) -> Dict:
+        """Visualization for this step; reused when the previous line was pure"""
+        if frame is self._pure_frame:
+            return self._last_viz
+        return self._dedup_viz(self.detect_and_visualize())
+    
+    def _dedup_viz(self, viz: Dict) -> Dict:
+        """Reuse the previous step's visualization object when nothing changed"""
+        if _strict_eq(viz, self._last_viz):
+            return self._last_viz
+        self._last_viz = viz
+        return viz
+    
+    def _snapshot_list(self, value) -> list:
+        """Copy a list for a step, sharing the copy with earlier equal snapshots"""
+        if not _ATOMIC_TYPES.issuperset(map(type, value)):
+            # Rows of a grid/DP table are mutated in place: copy them too
+            return copy.deepcopy(value)
+        # Types are part of the key: [1, 2] and [1.0, 2.0] are equal tuples
+        key = (tuple(value), tuple(map(type, value)))
+        cached = self._list_intern.get(key)
+        if cached is None:
+            cached = self._list_intern[key] = list(value)
+        return cached
+    
+    def _snapshot(self, seq, cap: int = SNAPSHOT_CAP) -> Tuple[list, bool]:
+        """First `cap` items of a container for a step, and whether it was cut"""
+        return self._copy_items(list(islice(seq, cap))), len(seq) > cap
+    
+    def _snapshot_top(self, stack, cap: int = SNAPSHOT_CAP) -> Tuple[list, bool]:
+        """Last `cap` items (the top end) of a stack for a step, and whether it was cut"""
+        try:
+            data = list(stack[-cap:])
+        except TypeError:  # not sliceable (deque...)
+            data = list(stack)[-cap:]
+        return self._copy_items(data), len(stack) > cap
+    
+    @staticmethod
+    def _copy_items(data: list) -> list:
+        """Deep-copy a fresh snapshot list unless all its items are atomic"""
+        if not _ATOMIC_TYPES.issuperset(map(type, data)):
+            return copy.deepcopy(data)
+        return data
+    
+    def _dict_snapshot(self, value: dict, fmt) -> Tuple[dict, List[str]]:
+        """Deep copy and fmt(value) lines, reused while the dict's contents are unchanged"""
+        entry = self._fmt_cache.get(id(value))
+        if entry is not None and entry[0] is value:
+            try:
+                if _strict_eq(value, entry[1]):
+                    return entry[1], entry[2]
+            except Exception:  # exotic __eq__; just rebuild
+                pass
+        snap = copy.deepcopy(value)
+        formatted = fmt(value)
+        self._fmt_cache[id(value)] = (value, snap, formatted)
+        return snap, formatted
+    
     def detect_and_visualize(self) -> Dict:
         """Automatically detect data structures and create visualizations"""
         
@@ -89,17 +368,22 @@ class UniversalCodeTracer:
         if viz:
             return viz
         
+        local_vars = self.local_vars
+        
         # Priority 2: Show arrays being modified
-        for name in ['arr', 'nums', 'array', 'list']:
-            if name in self.local_vars:
-                value = self.local_vars[name]
+        for name in self._array_names:
+            if name in local_vars:
+                value = local_vars[name]
                 if isinstance(value, list):
                     return self.visualize_list(name, value)
         
         # Priority 3: Show the most "interesting" variable
-        for name, value in self.local_vars.items():
-            # Skip internal variables and functions
-            if name.startswith('_') or callable(value):
+        for name in self._var_names:
+            if name not in local_vars:
+                continue
+            value = local_vars[name]
+            # Skip functions
+            if callable(value):
                 continue
             
             # Detect data structure type
@@ -120,9 +404,11 @@ class UniversalCodeTracer:
                 return self.visualize_queue(name, value)
         
         # Priority 4: Show simple variables if nothing else
-        for name, value in self.local_vars.items():
-            if not name.startswith('_') and isinstance(value, (int, float, str, bool)):
-                return self.visualize_variable(name, value)
+        for name in self._var_names:
+            if name in local_vars:
+                value = local_vars[name]
+                if isinstance(value, (int, float, str, bool)):
+                    return self.visualize_variable(name, value)
         
         return {'type': 'none', 'message': 'No variables to visualize'}
     
@@ -138,7 +424,7 @@ class UniversalCodeTracer:
             return self.visualize_dfs()
         
         # Check for sorting: array with i and j indices
-        for arr_name in ['arr', 'nums', 'array']:
+        for arr_name in self._sort_names:
             if arr_name in self.local_vars:
                 arr = self.local_vars[arr_name]
                 if isinstance(arr, list) and len(arr) > 0:
@@ -148,6 +434,10 @@ class UniversalCodeTracer:
         
         return None
     
+    def _lv(self, name: str, default: Any = None) -> Any:
+        """Read one variable from the current frame's locals"""
+        return self.local_vars.get(name, default)
+    
     def has_variables(self, var_names: List[str]) -> bool:
         """Check if all variable names exist"""
         return all(name in self.local_vars for name in var_names)
@@ -156,102 +446,110 @@ class UniversalCodeTracer:
         """Check if dict represents a graph (adjacency list)"""
         if not value:
             return False
-        # Graph: all values are lists/sets
-        return all(isinstance(v, (list, set)) for v in value.values())
+        # Graph: all values are lists/sets. Checking each distinct value type
+        # keeps the per-node work in C (graphs usually have one or two types)
+        return all(issubclass(t, (list, set)) for t in set(map(type, value.values())))
     
     # ==================== VISUALIZATION METHODS ====================
     
     def visualize_sorting(self, arr_name: str) -> Dict:
         """
         FIX 2: Visualize sorting algorithms with proper array cloning
-        Previously: arr = self.local_vars.get(arr_name, [])  # ❌ Reference!
-        Now: Creates a snapshot (deep copy already done in trace_execution)
+        arr is the live list, so the step stores a list() snapshot of it
         """
-        # FIX: This is now a deep copy from trace_execution, not a reference
-        arr = self.local_vars.get(arr_name, [])
+        arr = self._lv(arr_name, [])
         
-        i = self.local_vars.get('i', -1)
-        j = self.local_vars.get('j', -1)
-        min_idx = self.local_vars.get('min_idx', -1)  # For selection sort
+        i = self._lv('i', -1)
+        j = self._lv('j', -1)
+        min_idx = self._lv('min_idx', -1)  # For selection sort
         
-        highlight = []
-        operation = None
+        n = len(arr)
         
         # Determine what operation is happening
-        if j >= 0 and j < len(arr):
-            highlight.append(j)
-            if j + 1 < len(arr):
-                highlight.append(j + 1)
+        if 0 <= j < n:
+            highlight = [j, j + 1] if j + 1 < n else [j]
             operation = 'comparing'
-        elif min_idx >= 0 and min_idx < len(arr):
-            highlight.append(min_idx)
-            if i >= 0 and i < len(arr):
-                highlight.append(i)
+        elif 0 <= min_idx < n:
+            highlight = [min_idx, i] if 0 <= i < n else [min_idx]
             operation = 'selecting'
-        elif i >= 0 and i < len(arr):
-            highlight.append(i)
+        elif 0 <= i < n:
+            highlight = [i]
             operation = 'iteration'
+        else:
+            highlight = []
+            operation = None
         
         return {
             'type': 'array',
             'name': arr_name,
-            'data': list(arr),  # FIX: Explicit list() conversion for safety
-            'capacity': len(arr),
+            'data': self._snapshot_list(arr),  # FIX: snapshot, never the live list
+            'capacity': n,
             'highlight': highlight,
             'operation': operation
         }
     
     def visualize_bfs(self) -> Dict:
         """Visualize BFS algorithm"""
-        queue = self.local_vars.get('queue', deque())
-        visited = self.local_vars.get('visited', set())
-        graph = self.local_vars.get('graph', {})
-        current = self.local_vars.get('current', None) or self.local_vars.get('node', None)
+        queue = self._lv('queue', deque())
+        visited = self._lv('visited', set())
+        graph = self._lv('graph', {})
+        current = self._lv('current', None) or self._lv('node', None)
+        nodes, nodes_cut = self._snapshot(graph.keys())
+        visited_data, visited_cut = self._snapshot(visited)
+        queue_data, queue_cut = self._snapshot(queue)
         
         return {
             'type': 'graph_with_ds',
             'graph': {
                 'name': 'Graph',
-                'nodes': list(graph.keys()),
-                'edges': graph,
-                'positions': self.generate_positions(list(graph.keys())),
+                'nodes': nodes,
+                'edges': self._dict_snapshot(graph, self._format_graph)[0],
+                'positions': self.generate_positions(nodes),
                 'current_node': current,
-                'visited': list(visited),
-                'exploring': []
+                'visited': visited_data,
+                'exploring': [],
+                'truncated': nodes_cut or visited_cut
             },
             'data_structure': {
                 'type': 'queue',
                 'name': 'queue',
-                'data': list(queue),
-                'highlight': [len(queue) - 1] if queue else [],
-                'operation': 'processing'
+                'data': queue_data,
+                # Rear of the queue; not shown when the snapshot was cut
+                'highlight': [len(queue_data) - 1] if queue_data and not queue_cut else [],
+                'operation': 'processing',
+                'truncated': queue_cut
             }
         }
     
     def visualize_dfs(self) -> Dict:
         """Visualize DFS algorithm"""
-        stack = self.local_vars.get('stack', [])
-        visited = self.local_vars.get('visited', set())
-        graph = self.local_vars.get('graph', {})
-        current = self.local_vars.get('current', None) or self.local_vars.get('node', None)
+        stack = self._lv('stack', [])
+        visited = self._lv('visited', set())
+        graph = self._lv('graph', {})
+        current = self._lv('current', None) or self._lv('node', None)
+        nodes, nodes_cut = self._snapshot(graph.keys())
+        visited_data, visited_cut = self._snapshot(visited)
+        stack_data, stack_cut = self._snapshot_top(stack)
         
         return {
             'type': 'graph_with_ds',
             'graph': {
                 'name': 'Graph',
-                'nodes': list(graph.keys()),
-                'edges': graph,
-                'positions': self.generate_positions(list(graph.keys())),
+                'nodes': nodes,
+                'edges': self._dict_snapshot(graph, self._format_graph)[0],
+                'positions': self.generate_positions(nodes),
                 'current_node': current,
-                'visited': list(visited),
-                'exploring': []
+                'visited': visited_data,
+                'exploring': [],
+                'truncated': nodes_cut or visited_cut
             },
             'data_structure': {
                 'type': 'stack',
                 'name': 'stack',
-                'data': stack,
-                'highlight': [len(stack) - 1] if stack else [],
-                'operation': 'processing'
+                'data': stack_data,
+                'highlight': [len(stack_data) - 1] if stack_data else [],
+                'operation': 'processing',
+                'truncated': stack_cut
             }
         }
     
@@ -259,8 +557,8 @@ class UniversalCodeTracer:
         """Visualize list/array"""
         # Try to detect if there's an active index
         highlight = []
-        i = self.local_vars.get('i', -1)
-        j = self.local_vars.get('j', -1)
+        i = self._lv('i', -1)
+        j = self._lv('j', -1)
         
         if i >= 0 and i < len(value):
             highlight.append(i)
@@ -270,7 +568,7 @@ class UniversalCodeTracer:
         return {
             'type': 'array',
             'name': name,
-            'data': list(value),  # FIX: Explicit list() conversion
+            'data': self._snapshot_list(value),  # FIX: snapshot, never the live list
             'capacity': len(value),
             'highlight': highlight,
             'operation': None
@@ -278,47 +576,50 @@ class UniversalCodeTracer:
     
     def visualize_graph(self, name: str, value: dict) -> Dict:
         """Visualize graph structure"""
-        nodes = list(value.keys())
+        nodes, truncated = self._snapshot(value.keys())
+        edges, formatted = self._dict_snapshot(value, self._format_graph)
         return {
             'type': 'graph',
             'name': name,
             'nodes': nodes,
-            'edges': value,
+            'edges': edges,
             'positions': self.generate_positions(nodes),
-            'formatted': [f"{node} -> {', '.join(map(str, neighbors))}" 
-                         for node, neighbors in value.items()]
+            'formatted': formatted,
+            'truncated': truncated
         }
     
     def visualize_dict(self, name: str, value: dict) -> Dict:
         """Visualize dictionary"""
-        formatted = []
-        for k, v in value.items():
-            formatted.append(f"{k}: {v}")
+        data, formatted = self._dict_snapshot(value, self._format_dict)
         
         return {
             'type': 'dict',
             'name': name,
-            'data': value,
+            'data': data,
             'formatted': formatted
         }
     
     def visualize_set(self, name: str, value: set) -> Dict:
         """Visualize set as visited tracker"""
+        data, truncated = self._snapshot(value)
         return {
             'type': 'visited',
             'name': name,
-            'data': list(value),
-            'highlight': []
+            'data': data,
+            'highlight': [],
+            'truncated': truncated
         }
     
     def visualize_queue(self, name: str, value: deque) -> Dict:
         """Visualize queue"""
+        data, truncated = self._snapshot(value)
         return {
             'type': 'queue',
             'name': name,
-            'data': list(value),
+            'data': data,
             'highlight': [],
-            'operation': None
+            'operation': None,
+            'truncated': truncated
         }
     
     def visualize_variable(self, name: str, value: Any) -> Dict:
@@ -342,63 +643,126 @@ class UniversalCodeTracer:
             'var_type': type(value).__name__
         }
     
+    @staticmethod
+    def _format_graph(value: dict) -> List[str]:
+        return [f"{node} -> {', '.join(map(str, neighbors))}"
+                for node, neighbors in value.items()]
+    
+    @staticmethod
+    def _format_dict(value: dict) -> List[str]:
+        return [f"{k}: {v}" for k, v in value.items()]
+    
     def generate_positions(self, nodes: List) -> Dict:
-        """Generate circular positions for graph nodes"""
-        import math
-        n = len(nodes)
-        positions = {}
-        
-        radius = 180
-        center_x, center_y = 400, 250
-        
-        for i, node in enumerate(nodes):
-            angle = 2 * math.pi * i / n - math.pi / 2
-            x = center_x + radius * math.cos(angle)
-            y = center_y + radius * math.sin(angle)
-            positions[node] = {'x': int(x), 'y': int(y)}
+        """Generate circular positions for graph nodes (memoized per node set)"""
+        key = tuple(nodes)
+        cached = self._pos_cache.get(key)
+        if cached is not None:
+            return cached
         
+        positions = {node: {'x': x, 'y': y}
+                     for node, (x, y) in zip(nodes, _circle_layout(len(nodes)))}
+        self._pos_cache[key] = positions
         return positions
     
-    def generate_description(self, code_line: str) -> str:
-        """Generate natural language description of code line"""
-        code_line = code_line.strip()
-        
-        if not code_line:
-            return "Executing code..."
+    def _plan_statements(self):
+        """Plan every statement line up front; other lines are planned on first hit"""
+        try:
+            tree = ast.parse(self.code)
+        except SyntaxError:
+            return  # execute() reports the error
+        impure = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.stmt):
+                continue
+            if node.lineno not in self._line_plans:
+                self._line_plans[node.lineno] = self._plan_line(node.lineno)
+            # A line is pure only if every statement starting on it is
+            (self._pure_lines if _is_pure_stmt(node) else impure).add(node.lineno)
+        self._pure_lines -= impure
         
-        # Get current variable values for better descriptions
-        i = self.local_vars.get('i', None)
-        j = self.local_vars.get('j', None)
-        n = self.local_vars.get('n', None)
+        self._var_names = _bound_names(tree)
+        bound = set(self._var_names)
+        self._array_names = [n for n in ('arr', 'nums', 'array', 'list') if n in bound]
+        self._sort_names = [n for n in ('arr', 'nums', 'array') if n in bound]
+    
+    def _plan_line(self, line_no: int) -> LinePlan:
+        """Build the static plan for a 1-based source line"""
+        idx = line_no - 1
+        code_line = self._stripped_lines[idx] if 0 <= idx < len(self._stripped_lines) else ""
         
+        if not code_line or code_line.startswith('#'):
+            return LinePlan(None, None, "", None)
+        return LinePlan(code_line, *self.describe_line(code_line))
+    
+    @staticmethod
+    def describe_line(code_line: str) -> Tuple[Optional[str], str, Optional[str]]:
+        """Classify a source line into (template, fallback description, probed variable)"""
         if code_line.startswith('def '):
-            return "Defining function"
+            return None, "Defining function", None
         elif code_line.startswith('arr =') or code_line.startswith('array ='):
-            return "Creating array with initial values"
+            return None, "Creating array with initial values", None
         elif code_line.startswith('n ='):
-            return f"Getting array length: {n}" if n else "Getting array length"
+            return "Getting array length: {0}", "Getting array length", 'n'
         elif code_line.startswith('for i in range'):
-            return f"Starting outer loop (i = {i})" if i is not None else "Starting outer loop"
+            return "Starting outer loop (i = {0})", "Starting outer loop", 'i'
         elif code_line.startswith('for j in range'):
-            return f"Starting inner loop (j = {j})" if j is not None else "Starting inner loop"
+            return "Starting inner loop (j = {0})", "Starting inner loop", 'j'
         elif 'if arr[j] > arr[j+1]' in code_line or 'if arr[j] > arr[j + 1]' in code_line:
-            return f"Comparing elements at positions {j} and {j+1}" if j is not None else "Comparing adjacent elements"
+            return "Comparing elements at positions {0} and {1}", "Comparing adjacent elements", 'j'
         elif 'arr[j], arr[j+1]' in code_line or 'arr[j], arr[j + 1]' in code_line:
-            return f"Swapping elements at positions {j} and {j+1}" if j is not None else "Swapping elements"
+            return "Swapping elements at positions {0} and {1}", "Swapping elements", 'j'
         elif '=' in code_line and 'if' not in code_line:
             var_name = code_line.split('=')[0].strip()
-            return f"Setting {var_name}"
+            return None, f"Setting {var_name}", None
         elif 'append' in code_line:
-            return "Adding element to list"
+            return None, "Adding element to list", None
         elif 'pop' in code_line:
-            return "Removing element"
+            return None, "Removing element", None
         elif 'print' in code_line:
-            return "Printing output"
+            return None, "Printing output", None
         else:
-            return f"Executing: {code_line[:50]}"
+            return None, f"Executing: {code_line[:50]}", None
+    
+    def generate_description(self, plan: LinePlan) -> str:
+        """Generate natural language description of a planned line"""
+        if plan.probe is None:
+            return plan.fallback
+        
+        # Current variable value for a more specific description
+        value = self._lv(plan.probe)
+        if value is None:
+            return plan.fallback
+        desc = plan.template.format(value, value + 1 if isinstance(value, int) else value)
+        return self._desc_intern.setdefault(desc, desc)
+    
+    def _run_monitored(self, compiled, exec_globals) -> bool:
+        """Run compiled code under sys.monitoring; False if it is unavailable"""
+        with _monitor_lock:
+            tool_id = _claim_monitor_tool_id()
+            if tool_id is None:
+                return False
+            code_objects = _collect_code_objects(compiled)
+            events = _monitoring.events
+            for code in code_objects:
+                _monitored_code[id(code)] = self
+                _monitoring.set_local_events(
+                    tool_id, code, events.LINE | events.PY_START | events.PY_RETURN
+                )
+        try:
+            exec(compiled, exec_globals)
+        finally:
+            with _monitor_lock:
+                for code in code_objects:
+                    _monitoring.set_local_events(tool_id, code, 0)
+                    _monitored_code.pop(id(code), None)
+        return True
     
-    def execute(self, max_steps: int = 100) -> Dict:
-        """Execute code with tracing"""
+    def execute(self, max_steps: Optional[int] = None) -> Dict:
+        """Execute code with tracing (max_steps overrides the constructor's limit)"""
+        if max_steps is not None:
+            self._max_steps = max_steps
+        max_steps = self._max_steps
+        
         try:
             # Create execution namespace
             exec_globals = {
@@ -406,18 +770,27 @@ class UniversalCodeTracer:
                 'deque': deque,
             }
             
-            # Set up tracing
-            sys.settrace(self.trace_execution)
-            
-            # Execute code
-            exec(self.code, exec_globals)
-            
-            # Stop tracing
-            sys.settrace(None)
+            # Execute code with line tracing
+            compiled = compile(self.code, _VIZ_FILENAME, 'exec')
+            # The budget is known, so the step list never has to grow
+            self.steps = [None] * max_steps
+            self._w = 0
+            try:
+                if not self._run_monitored(compiled, exec_globals):
+                    sys.settrace(self.trace_execution)
+                    try:
+                        exec(compiled, exec_globals)
+                    finally:
+                        sys.settrace(None)
+            except _StepLimitReached:
+                pass
+            finally:
+                self._pure_frame = None
+                del self.steps[self._w:]  # drop unused slots, also on errors
             
-            # Limit steps to prevent overwhelming UI
-            if len(self.steps) > max_steps:
-                self.steps = self.steps[:max_steps]
+            # Limit steps to prevent overwhelming UI (the flag also covers
+            # user code that swallowed _StepLimitReached with a bare except)
+            if self._limit_reached:
                 self.steps.append({
                     'line': 0,
                     'code': '...',
@@ -432,7 +805,6 @@ class UniversalCodeTracer:
             }
             
         except Exception as e:
-            sys.settrace(None)
             return {
                 'success': False,
                 'error': str(e),